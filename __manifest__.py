@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Adroc Facturación Global',
-    'version': '19.0.1.0.5',
+    'version': '19.0.1.1.0',
     'category': 'Accounting',
     'summary': 'Reportes y funcionalidades globales de facturación',
     'description': """
@@ -12,6 +12,11 @@
         - Reporte de Liquidación de Gastos de Importación
         - Agrupación por embarque y empresa
         - Selección de adjuntos a incluir en reportes
+        - Registro de liquidaciones emitidas y liquidaciones parciales/acumuladas
+        - Resumen de facturación por embarque, empresa y moneda
+        - Actualización en lote de Fecha Pago Contraseña y Comentario
+        - Búsqueda en lote de facturas por Serie y No. Factura de Cuenta Ajena
+        - Preparación anticipada de adjuntos para la Liquidación de Gastos
     """,
     'author': 'Adroc',
     'website': '',
@@ -21,13 +26,19 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'security/liquidacion_gastos_security.xml',
+        'data/ir_cron_data.xml',
         'views/account_move_views.xml',
+        'views/liquidacion_gastos_snapshot_views.xml',
         'wizards/liquidacion_gastos_wizard_views.xml',
         'wizards/facturas_entregadas_wizard_views.xml',
+        'wizards/actualizacion_contrasena_wizard_views.xml',
+        'wizards/busqueda_cuenta_ajena_wizard_views.xml',
         'report/facturas_entregadas_report.xml',
         'report/facturas_entregadas_template.xml',
         'report/liquidacion_gastos_report.xml',
         'report/liquidacion_gastos_template.xml',
+        'report/liquidacion_gastos_summary_views.xml',
     ],
     'installable': True,
     'application': False,
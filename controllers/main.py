@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request, content_disposition
+
+
+class FacturasEntregadasController(http.Controller):
+
+    @http.route('/adroc_facturacion_global/facturas_entregadas/<int:wizard_id>/zip',
+                type='http', auth='user')
+    def download_partner_zip(self, wizard_id, **kwargs):
+        """Descarga el ZIP de Facturas por Enviar sin guardarlo como adjunto."""
+        wizard = request.env['facturas.entregadas.wizard'].browse(wizard_id).exists()
+        if not wizard:
+            raise request.not_found()
+
+        filename, content = wizard._get_partner_zip()
+        return request.make_response(content, headers=[
+            ('Content-Type', 'application/zip'),
+            ('Content-Length', len(content)),
+            ('Content-Disposition', content_disposition(filename)),
+        ])
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 
 from . import account_move
+from . import liquidacion_gastos_snapshot
+from . import liquidacion_attachment_cache
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from odoo import api, fields, models
+from odoo.tools.sql import column_exists, create_index
+
+# Columnas del gasto usadas para buscar facturas por Cuenta Ajena
+EXPENSE_NUMBER_COLUMNS = ('invoice_number', 'x_studio_nmero_de_dte')
+EXPENSE_SERIES_COLUMNS = ('invoice_series', 'x_studio_serie')
 
 
 class AccountMove(models.Model):
@@ -43,6 +48,60 @@ class AccountMove(models.Model):
         help='Número de la factura del gasto relacionado',
     )
 
+    def init(self):
+        super().init()
+        cr = self.env.cr
+
+        # Índices para la búsqueda en lote por Serie y No. Factura de Cuenta Ajena.
+        # Las columnas x_studio_* sólo existen si fueron creadas con Studio.
+        for column in EXPENSE_NUMBER_COLUMNS + EXPENSE_SERIES_COLUMNS:
+            if not column_exists(cr, self._table, column):
+                continue
+            create_index(cr, f'{self._table}_{column}_ca_index', self._table, [f'"{column}"'])
+            if column in EXPENSE_NUMBER_COLUMNS and self.env.registry.has_trigram:
+                create_index(
+                    cr, f'{self._table}_{column}_ca_trgm_index', self._table,
+                    [f'"{column}" gin_trgm_ops'], method='gin',
+                )
+
+        # Búsquedas de líneas de cuenta ajena por gasto y por asiento
+        line_table = self.env['mrdc.external_account.line']._table
+        for column in ('expense_id', 'move_id'):
+            create_index(cr, f'{line_table}_{column}_ca_index', line_table, [f'"{column}"'])
+
+    @api.model
+    def _get_customer_invoice_domain(self):
+        """Dominio de facturas de cliente de la acción en curso.
+
+        El cliente web envía siempre ``active_domain`` junto con ``active_ids``,
+        pero en "seleccionar todo" la lista de IDs viene truncada en
+        ``web.active_ids_limit``. En ese caso (o si no hay IDs) se usa
+        ``active_domain``; si no, los IDs seleccionados. En ambos casos el
+        filtro de ``move_type`` se resuelve en SQL.
+
+        Facturas por Enviar guarda el dominio y lo resuelve al imprimir;
+        Liquidación de Gastos lista las facturas, así que limita la cantidad.
+        Retorna False si el contexto no viene de facturas.
+        """
+        context = self.env.context
+        if context.get('active_model') != 'account.move':
+            return False
+
+        active_ids = context.get('active_ids') or []
+        active_domain = context.get('active_domain')
+        active_ids_limit = int(self.env['ir.config_parameter'].sudo().get_param(
+            'web.active_ids_limit', 20000,
+        ))
+        if active_domain is not None and (not active_ids or len(active_ids) >= active_ids_limit):
+            # Selección de todo el dominio
+            domain = list(active_domain)
+        elif active_ids:
+            domain = [('id', 'in', active_ids)]
+        else:
+            return False
+
+        return domain + [('move_type', 'in', ('out_invoice', 'out_refund'))]
+
     @api.depends('name')
     def _compute_related_external_line(self):
         ExternalLine = self.env['mrdc.external_account.line']
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import logging
+import os
+import time
+from datetime import timedelta
+from io import BytesIO
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+from ..report.liquidacion_gastos_report_merge import (
+    HAS_PYPDF2,
+    _image_data_to_pdf,
+)
+
+_logger = logging.getLogger(__name__)
+
+if HAS_PYPDF2:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfFileReader as PdfReader
+
+# Sólo se preparan adjuntos de embarques y de facturas de cliente con
+# embarque creados en los últimos días (los que se imprimen en la liquidación)
+PREWARM_MAX_AGE_DAYS = 90
+# Límites por ejecución del cron
+PREWARM_BATCH_SIZE = 50
+PREWARM_TIME_LIMIT = 120
+# Tope del conteo de pendientes, para no recorrer todos los adjuntos
+PREWARM_BACKLOG_LIMIT = 1000
+
+
+class LiquidacionAttachmentCache(models.Model):
+    _name = 'liquidacion.attachment.cache'
+    _description = 'Adjunto preparado para Liquidación de Gastos'
+
+    attachment_id = fields.Many2one(
+        'ir.attachment',
+        string='Adjunto',
+        required=True,
+        index=True,
+        ondelete='cascade',
+    )
+    # Checksum del adjunto al prepararlo; si cambia, se vuelve a preparar
+    checksum = fields.Char(string='Checksum', readonly=True)
+    state = fields.Selection([
+        ('ready', 'Listo'),
+        ('error', 'Error'),
+    ], string='Estado', required=True, default='ready')
+    page_count = fields.Integer(string='Páginas')
+    # PDF derivado (sólo para imágenes; los PDF se usan tal cual)
+    pdf_file = fields.Binary(string='PDF', attachment=True)
+    error = fields.Char(string='Error')
+
+    _attachment_uniq = models.Constraint(
+        'UNIQUE(attachment_id)',
+        'Cada adjunto sólo puede prepararse una vez.',
+    )
+
+    @api.model
+    def _pending_query(self, limit=None):
+        """Adjuntos imprimibles sin preparar o modificados desde que se prepararon.
+
+        Se limita a adjuntos recientes de embarques y de facturas de cliente
+        con embarque; facturas de proveedor e historial no se preparan.
+        """
+        return SQL(
+            """
+            SELECT a.id
+            FROM ir_attachment a
+            LEFT JOIN %s c ON c.attachment_id = a.id
+            LEFT JOIN %s m ON a.res_model = 'account.move' AND m.id = a.res_id
+            WHERE a.res_field IS NULL
+              AND a.create_date >= %s
+              AND (a.res_model = 'mrdc.shipment'
+                   OR (m.mrdc_shipment_id IS NOT NULL AND m.move_type IN %s))
+              AND (a.mimetype = 'application/pdf' OR a.mimetype LIKE %s)
+              AND (c.id IS NULL OR c.checksum IS DISTINCT FROM a.checksum)
+            ORDER BY a.id DESC
+            %s
+            """,
+            SQL.identifier(self._table),
+            SQL.identifier(self.env['account.move']._table),
+            fields.Datetime.now() - timedelta(days=PREWARM_MAX_AGE_DAYS),
+            ('out_invoice', 'out_refund'),
+            'image/%',
+            SQL('LIMIT %s', limit) if limit else SQL(),
+        )
+
+    @api.model
+    def _get_backlog_count(self, limit=PREWARM_BACKLOG_LIMIT):
+        """Cantidad de adjuntos pendientes de preparar, como máximo ``limit``."""
+        self.env.cr.execute(SQL(
+            'SELECT COUNT(*) FROM (%s) pending', self._pending_query(limit=limit),
+        ))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _cron_prewarm_attachments(self, batch_size=PREWARM_BATCH_SIZE, time_limit=PREWARM_TIME_LIMIT):
+        """Prepara por adelantado los adjuntos que se concatenarán en la liquidación.
+
+        Procesa como máximo ``batch_size`` adjuntos o ``time_limit`` segundos
+        por ejecución, confirmando cada adjunto para no perder trabajo.
+        """
+        if not HAS_PYPDF2:
+            _logger.warning("PyPDF2 no disponible, no se pueden preparar adjuntos")
+            return
+
+        self.env.cr.execute(self._pending_query(limit=batch_size))
+        attachment_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not attachment_ids:
+            return
+
+        # Sólo se cuenta el resto si el lote viene lleno, y con tope
+        backlog = len(attachment_ids)
+        if backlog >= batch_size:
+            backlog = self._get_backlog_count()
+        _logger.info("Adjuntos de liquidación pendientes de preparar: %s%s",
+                     backlog, '+' if backlog >= PREWARM_BACKLOG_LIMIT else '')
+
+        deadline = time.monotonic() + time_limit
+        Attachment = self.env['ir.attachment'].sudo()
+        for attachment in Attachment.browse(attachment_ids):
+            if time.monotonic() > deadline:
+                break
+            self._prewarm_attachment(attachment)
+            backlog -= 1
+            self.env['ir.cron']._commit_progress(1, remaining=max(backlog, 0))
+
+    @api.autovacuum
+    def _gc_orphan_derived_pdfs(self):
+        """Elimina los PDF derivados de registros de caché ya borrados.
+
+        Al borrar el adjunto original, ``ondelete='cascade'`` borra la fila
+        de caché en PostgreSQL sin pasar por el ORM, y el ``ir.attachment``
+        de ``pdf_file`` queda huérfano.
+        """
+        self.env.cr.execute(SQL(
+            """
+            SELECT a.id
+            FROM ir_attachment a
+            WHERE a.res_model = %s
+              AND a.res_field = 'pdf_file'
+              AND NOT EXISTS (SELECT 1 FROM %s c WHERE c.id = a.res_id)
+            """,
+            self._name,
+            SQL.identifier(self._table),
+        ))
+        orphan_ids = [row[0] for row in self.env.cr.fetchall()]
+        if orphan_ids:
+            self.env['ir.attachment'].sudo().browse(orphan_ids).unlink()
+            _logger.info("PDF derivados huérfanos eliminados: %s", len(orphan_ids))
+
+    @api.model
+    def _prewarm_attachment(self, attachment):
+        """Valida, convierte y cuenta las páginas de un adjunto."""
+        values = {
+            'attachment_id': attachment.id,
+            'checksum': attachment.checksum,
+            'state': 'ready',
+            'pdf_file': False,
+            'error': False,
+        }
+        try:
+            raw = attachment.raw
+            if attachment.mimetype == 'application/pdf':
+                pdf_data = raw
+            else:
+                pdf_data = _image_data_to_pdf(raw, attachment.name)
+                if not pdf_data:
+                    raise ValueError('No se pudo convertir la imagen')
+                values['pdf_file'] = base64.b64encode(pdf_data)
+
+            reader = PdfReader(BytesIO(pdf_data), strict=False)
+            values['page_count'] = len(reader.pages)
+
+        except Exception as e:
+            _logger.warning(f"Error al preparar adjunto {attachment.name}: {e}")
+            values.update(state='error', page_count=0, pdf_file=False, error=str(e)[:250])
+
+        cache = self.search([('attachment_id', '=', attachment.id)], limit=1)
+        if cache:
+            cache.write(values)
+        else:
+            cache = self.create(values)
+        return cache
+
+    @api.model
+    def _get_prepared_parts(self, attachments):
+        """Estado de los adjuntos ya preparados y vigentes.
+
+        Retorna un diccionario {attachment_id: (state, full_path)} donde
+        ``full_path`` es la ruta en el filestore del PDF derivado, o False
+        si el adjunto se usa tal cual.
+        """
+        caches = self.sudo().search([('attachment_id', 'in', attachments.ids)])
+        checksums = {att.id: att.checksum for att in attachments}
+        caches = caches.filtered(
+            lambda c: c.checksum and c.checksum == checksums.get(c.attachment_id.id)
+        )
+
+        Attachment = self.env['ir.attachment'].sudo()
+        derived = Attachment.search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'pdf_file'),
+            ('res_id', 'in', caches.ids),
+        ])
+        # Sólo se usan los PDF derivados presentes en el filestore local; si
+        # no (almacenamiento externo), el adjunto se prepara al imprimir
+        paths = {}
+        for att in derived:
+            full_path = att.store_fname and Attachment._full_path(att.store_fname)
+            if full_path and os.path.isfile(full_path):
+                paths[att.res_id] = full_path
+
+        return {
+            cache.attachment_id.id: (cache.state, paths.get(cache.id, False))
+            for cache in caches
+        }
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+
+class LiquidacionGastosSnapshot(models.Model):
+    _name = 'liquidacion.gastos.snapshot'
+    _description = 'Liquidación de Gastos emitida'
+    _order = 'create_date desc, id desc'
+
+    name = fields.Char(string='Referencia', required=True, readonly=True)
+    company_id = fields.Many2one(
+        'res.company',
+        string='Empresa',
+        required=True,
+        readonly=True,
+        index=True,
+        default=lambda self: self.env.company,
+    )
+    shipment_ids = fields.Many2many(
+        'mrdc.shipment',
+        'liquidacion_gastos_snapshot_shipment_rel',
+        'snapshot_id',
+        'shipment_id',
+        string='Embarques',
+        readonly=True,
+    )
+    invoice_ids = fields.Many2many(
+        'account.move',
+        'liquidacion_gastos_snapshot_invoice_rel',
+        'snapshot_id',
+        'invoice_id',
+        string='Facturas',
+        readonly=True,
+    )
+    attachment_ids = fields.Many2many(
+        'ir.attachment',
+        'liquidacion_gastos_snapshot_attachment_rel',
+        'snapshot_id',
+        'attachment_id',
+        string='Adjuntos incluidos',
+        readonly=True,
+    )
+    liquidation_mode = fields.Selection([
+        ('full', 'Completa'),
+        ('delta', 'Sólo lo nuevo'),
+        ('cumulative', 'Acumulada'),
+    ], string='Modo', readonly=True)
+    report_type = fields.Selection([
+        ('normal', 'Normal'),
+        ('assukargo', 'Assukargo'),
+    ], string='Formato de Reporte', readonly=True)
+    total_gtq = fields.Float(string='Total Q', readonly=True)
+    total_usd = fields.Float(string='Total $', readonly=True)
+    invoice_count = fields.Integer(
+        string='# Facturas',
+        compute='_compute_invoice_count',
+    )
+    # PDF de esta emisión (sin las emisiones anteriores)
+    pdf_file = fields.Binary(string='PDF', attachment=True, readonly=True)
+    pdf_filename = fields.Char(string='Nombre del archivo', readonly=True)
+
+    @api.depends('invoice_ids')
+    def _compute_invoice_count(self):
+        for snapshot in self:
+            snapshot.invoice_count = len(snapshot.invoice_ids)
+
+    @api.model
+    def _get_previous_snapshots(self, shipments):
+        """Emisiones anteriores de los embarques dados, de la más antigua a la más reciente."""
+        if not shipments:
+            return self.browse()
+        return self.search(
+            [('shipment_ids', 'in', shipments.ids)],
+            order='create_date asc, id asc',
+        )
+
+    @api.model
+    def _get_cumulative_snapshots(self, snapshots):
+        """Emisiones a anteponer en una liquidación acumulada.
+
+        Se omiten las emisiones cuyas facturas ya están todas en una emisión
+        completa posterior, para no repetir páginas. Conserva el orden dado
+        (de la más antigua a la más reciente).
+        """
+        covered_ids = set()
+        kept_ids = []
+        for snapshot in reversed(snapshots):
+            invoice_ids = set(snapshot.invoice_ids.ids)
+            if not invoice_ids <= covered_ids:
+                kept_ids.append(snapshot.id)
+            if snapshot.liquidation_mode == 'full':
+                covered_ids |= invoice_ids
+        return self.browse(kept_ids[::-1])
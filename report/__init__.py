@@ -3,3 +3,4 @@
 from . import facturas_entregadas_parser
 from . import liquidacion_gastos_parser
 from . import liquidacion_gastos_report_merge
+from . import liquidacion_gastos_summary
@@ -10,53 +10,113 @@ class FacturasEntregadasReport(models.AbstractModel):
 
     @api.model
     def _get_report_values(self, docids, data=None):
-        invoices = self.env['account.move'].browse(docids)
+        data = data or {}
 
-        # Filtrar solo facturas de cliente
-        customer_invoices = invoices.filtered(
-            lambda inv: inv.move_type in ('out_invoice', 'out_refund')
-        )
+        # Si viene de wizard, usar lo que el wizard ya agrupó en el servidor
+        if data.get('wizard_id'):
+            wizard = self.env['facturas.entregadas.wizard'].browse(data['wizard_id'])
+            prepared = wizard._get_prepared_report_data()
+        else:
+            invoices = self.env['account.move'].browse(docids)
+
+            # Filtrar solo facturas de cliente
+            customer_invoices = invoices.filtered(
+                lambda inv: inv.move_type in ('out_invoice', 'out_refund')
+            )
+
+            # Obtener direcciones personalizadas del wizard si existen
+            prepared = self._prepare_report_data(
+                customer_invoices, data.get('custom_addresses') or {},
+            )
+
+        return self._get_report_values_from_prepared(docids, prepared, data)
 
+    @api.model
+    def _prepare_report_data(self, customer_invoices, custom_addresses=None, partner_groups=None):
+        """Prepara una sola vez los datos del reporte en forma serializable.
+
+        ``partner_groups`` son tuplas (partner, invoice_ids, total) ya
+        agrupadas por el wizard; si no se dan, se agrupa aquí.
+        """
         if not customer_invoices:
             raise UserError(_('Debe seleccionar facturas de cliente.'))
 
-        # Obtener direcciones personalizadas del wizard si existen
-        custom_addresses = {}
-        if data and data.get('custom_addresses'):
-            custom_addresses = data.get('custom_addresses', {})
-
         # Agrupar por partner
-        partners_data = self._get_invoices_by_partner(customer_invoices, custom_addresses)
+        partners_data = self._get_invoices_by_partner(
+            customer_invoices, custom_addresses, partner_groups,
+        )
+
+        return {
+            'invoice_ids': customer_invoices.ids,
+            'partners': [{
+                'partner_id': pdata['partner'].id,
+                'company_ids': pdata['companies'].ids,
+                'groups': [{
+                    'shipment_id': group['shipment'].id,
+                    'shipment_name': group['shipment_name'],
+                    'invoice_ids': group['invoices'].ids,
+                } for group in pdata['groups']],
+                'totals': pdata['totals'],
+                'custom_address': pdata['custom_address'],
+            } for pdata in partners_data],
+        }
+
+    @api.model
+    def _get_report_values_from_prepared(self, docids, prepared, data=None):
+        """Arma los valores del template a partir de los datos preparados."""
+        Move = self.env['account.move']
+        Partner = self.env['res.partner']
+        Company = self.env['res.company']
+        Shipment = self.env['mrdc.shipment']
+
+        partners_data = [{
+            'partner': Partner.browse(pdata['partner_id']),
+            'companies': Company.browse(pdata['company_ids']),
+            'groups': [{
+                'shipment': Shipment.browse(group['shipment_id']) if group['shipment_id'] else Shipment,
+                'shipment_name': group['shipment_name'],
+                'invoices': Move.browse(group['invoice_ids']),
+            } for group in pdata['groups']],
+            'totals': pdata['totals'],
+            'custom_address': pdata['custom_address'],
+        } for pdata in prepared['partners']]
 
         return {
             'doc_ids': docids,
             'doc_model': 'account.move',
-            'docs': customer_invoices,
+            'docs': Move.browse(prepared['invoice_ids']),
             'partners_data': partners_data,
             'company': self.env.company,
+            'split_markers': bool(data and data.get('split_by_partner')),
         }
 
-    def _get_invoices_by_partner(self, invoices, custom_addresses=None):
+    def _get_invoices_by_partner(self, invoices, custom_addresses=None, partner_groups=None):
         """Agrupa las facturas por partner y luego por embarque."""
         partners_data = []
         custom_addresses = custom_addresses or {}
 
-        # Agrupar por partner
-        partner_ids = invoices.mapped('partner_id')
+        # Agrupar por partner, salvo que ya venga agrupado
+        if partner_groups is None:
+            partner_groups = [
+                (partner, invoices.filtered(lambda inv: inv.partner_id == partner).ids, None)
+                for partner in invoices.mapped('partner_id')
+            ]
 
-        for partner in partner_ids.sorted(key=lambda p: p.name or ''):
-            partner_invoices = invoices.filtered(lambda inv: inv.partner_id == partner)
+        Move = self.env['account.move']
+        for partner, invoice_ids, total in sorted(partner_groups, key=lambda g: g[0].name or ''):
+            partner_invoices = Move.browse(invoice_ids)
             # Obtener lista de empresas únicas para colores
             companies = partner_invoices.mapped('company_id').sorted(key=lambda c: c.name or '')
 
             # Obtener dirección personalizada o usar la del partner
-            custom_address = custom_addresses.get(partner.id, '')
+            # Las claves llegan como texto si los datos pasaron por JSON
+            custom_address = custom_addresses.get(partner.id) or custom_addresses.get(str(partner.id), '')
 
             partners_data.append({
                 'partner': partner,
                 'companies': companies,
                 'groups': self._get_invoices_grouped(partner_invoices),
-                'totals': self._get_totals(partner_invoices),
+                'totals': self._get_totals(partner_invoices, total),
                 'custom_address': custom_address,
             })
 
@@ -84,9 +144,13 @@ class FacturasEntregadasReport(models.AbstractModel):
 
         return list(grouped.values())
 
-    def _get_totals(self, invoices):
-        """Calcula los totales del reporte."""
-        total = sum(invoices.mapped('amount_total'))
+    def _get_totals(self, invoices, total=None):
+        """Calcula los totales del reporte.
+
+        ``total`` es la suma ya calculada en SQL por el wizard, si existe.
+        """
+        if total is None:
+            total = sum(invoices.mapped('amount_total'))
         total_cuenta_ajena = sum(
             invoices.filtered('mrdc_external_account_id').mapped('amount_total')
         )
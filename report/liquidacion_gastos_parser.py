@@ -3,8 +3,9 @@
 import base64
 from datetime import date
 from io import BytesIO
-from odoo import api, models, fields, _
+from odoo import api, models, fields, tools, _
 from odoo.exceptions import UserError
+from odoo.tools.image import image_data_uri
 
 # Fecha mínima para ordenamiento
 MIN_DATE = date(1900, 1, 1)
@@ -27,45 +28,104 @@ class LiquidacionGastosReport(models.AbstractModel):
 
     @api.model
     def _get_report_values(self, docids, data=None):
-        # Si viene de wizard, usar los datos del wizard
-        report_type = 'normal'
-        ordered_attachment_ids = []
-        if data and data.get('wizard_id'):
+        data = data or {}
+        report_type = data.get('report_type', 'normal')
+
+        # Si viene de wizard, usar los datos que el wizard preparó en el servidor
+        prepared = False
+        if data.get('wizard_id'):
             wizard = self.env['liquidacion.gastos.wizard'].browse(data['wizard_id'])
-            customer_invoices = wizard.invoice_ids
-            report_type = data.get('report_type', 'normal')
-            # Usar IDs ordenados si están disponibles
-            ordered_attachment_ids = data.get('ordered_attachment_ids')
-            if ordered_attachment_ids is not None:
-                # Usar lista ordenada (puede ser vacía para Assukargo)
-                selected_attachments = self.env['ir.attachment'].browse(ordered_attachment_ids)
+            prepared = wizard.prepared_data
+            if prepared and prepared.get('attachments') is not None:
+                report_type = prepared.get('report_type', report_type)
             else:
-                selected_attachments = wizard.attachment_ids
+                prepared = self._prepare_report_data(wizard.invoice_ids, wizard.attachment_ids)
         else:
             invoices = self.env['account.move'].browse(docids)
             customer_invoices = invoices.filtered(
                 lambda inv: inv.move_type in ('out_invoice', 'out_refund')
             )
-            selected_attachments = self.env['ir.attachment']
+            prepared = self._prepare_report_data(customer_invoices)
+
+        return self._get_report_values_from_prepared(docids, prepared, report_type)
+
+    @api.model
+    def _prepare_invoice_data(self, customer_invoices, shipments=None):
+        """Agrupa y totaliza las facturas una sola vez, en forma serializable.
 
+        Sólo contiene IDs y totales. El wizard lo calcula al crearse y lo
+        guarda en ``prepared_data``; el parser y el merge lo reutilizan.
+        """
         if not customer_invoices:
             raise UserError(_('Debe seleccionar facturas de cliente.'))
 
         # Obtener todos los embarques (pueden ser múltiples)
-        shipments = customer_invoices.mapped('mrdc_shipment_id')
-        shipments = shipments.filtered(lambda s: s)
+        if shipments is None:
+            shipments = customer_invoices.mapped('mrdc_shipment_id')
+            shipments = shipments.filtered(lambda s: s)
 
         # Agrupar facturas por empresa
-        companies_data = self._get_invoices_by_company(customer_invoices)
+        companies = [{
+            'company_id': cdata['company'].id,
+            'invoice_ids': cdata['invoices'].ids,
+            'total_gtq': cdata['total_gtq'],
+            'total_usd': cdata['total_usd'],
+        } for cdata in self._get_invoices_by_company(customer_invoices)]
+
+        return {
+            'invoice_ids': customer_invoices.ids,
+            'shipment_ids': shipments.ids,
+            'companies': companies,
+            # Calcular totales generales
+            'grand_totals': self._get_grand_totals(customer_invoices),
+        }
+
+    @api.model
+    def _prepare_attachment_data(self, attachments):
+        """IDs de los adjuntos separados por tipo, preservando el orden."""
+        processed = self._process_selected_attachments(attachments)
+        return {key: processed[key].ids for key in ('images', 'pdfs', 'others', 'all')}
+
+    @api.model
+    def _prepare_report_data(self, customer_invoices, selected_attachments=None):
+        """Prepara los datos del reporte cuando no vienen del wizard."""
+        prepared = self._prepare_invoice_data(customer_invoices)
 
         # Obtener adjuntos seleccionados o todos si no viene de wizard
         if selected_attachments:
-            attachments = self._process_selected_attachments(selected_attachments)
+            attachments = selected_attachments
         else:
-            attachments = self._get_attachments(shipments, customer_invoices)
+            shipments = self.env['mrdc.shipment'].browse(prepared['shipment_ids'])
+            attachments = self._get_attachments(shipments, customer_invoices)['all']
+
+        prepared['attachments'] = self._prepare_attachment_data(attachments)
+        return prepared
 
-        # Calcular totales generales
-        grand_totals = self._get_grand_totals(customer_invoices)
+    @api.model
+    def _get_report_values_from_prepared(self, docids, prepared, report_type='normal'):
+        """Arma los valores del template a partir de los datos preparados."""
+        Move = self.env['account.move']
+        Company = self.env['res.company']
+        Attachment = self.env['ir.attachment']
+
+        customer_invoices = Move.browse(prepared['invoice_ids'])
+        shipments = self.env['mrdc.shipment'].browse(prepared['shipment_ids'])
+
+        companies_data = []
+        for company_data in prepared['companies']:
+            company = Company.browse(company_data['company_id'])
+            companies_data.append(dict(
+                self._get_company_header(company),
+                company=company,
+                invoices=Move.browse(company_data['invoice_ids']),
+                total_gtq=company_data['total_gtq'],
+                total_usd=company_data['total_usd'],
+            ))
+
+        attachments = {
+            key: Attachment.browse(ids) for key, ids in prepared['attachments'].items()
+        }
+        attachments['has_pypdf2'] = HAS_PYPDF2
 
         return {
             'doc_ids': docids,
@@ -75,7 +135,7 @@ class LiquidacionGastosReport(models.AbstractModel):
             'shipment': shipments[0] if shipments else False,
             'companies_data': companies_data,
             'attachments': attachments,
-            'grand_totals': grand_totals,
+            'grand_totals': prepared['grand_totals'],
             'today': fields.Date.today(),
             'report_type': report_type,
         }
@@ -106,12 +166,42 @@ class LiquidacionGastosReport(models.AbstractModel):
                 )),
                 'total_gtq': totals_gtq,
                 'total_usd': totals_usd,
-                'bank_gtq': company.cuenta if hasattr(company, 'cuenta') else False,
-                'bank_usd': company.cuenta_dolar if hasattr(company, 'cuenta_dolar') else False,
             })
 
         return companies_data
 
+    def _get_company_header(self, company):
+        """Logo reducido y cuentas bancarias de la empresa para el encabezado."""
+        logo_uri, bank_gtq_id, bank_usd_id = self._get_company_header_cached(
+            company.id, company.write_date,
+        )
+        Bank = self.env['res.partner.bank']
+        return {
+            'logo_uri': logo_uri,
+            'bank_gtq': Bank.browse(bank_gtq_id) if bank_gtq_id else False,
+            'bank_usd': Bank.browse(bank_usd_id) if bank_usd_id else False,
+        }
+
+    @tools.ormcache('company_id', 'write_date')
+    def _get_company_header_cached(self, company_id, write_date):
+        """Cachea por empresa el data URI del logo y las cuentas bancarias.
+
+        La clave incluye ``write_date``, así que cualquier cambio en la
+        empresa genera una entrada nueva; las anteriores salen del LRU con el
+        tiempo. El caché es por proceso: cada worker arma sus propias
+        entradas. Se usa ``logo_web`` (logo reducido y guardado en la base)
+        para no incrustar el logo a resolución completa.
+        """
+        company = self.env['res.company'].browse(company_id)
+        logo = company.logo_web or company.logo
+        bank_gtq = company.cuenta if 'cuenta' in company._fields else False
+        bank_usd = company.cuenta_dolar if 'cuenta_dolar' in company._fields else False
+        return (
+            image_data_uri(logo) if logo else False,
+            bank_gtq.id if bank_gtq else False,
+            bank_usd.id if bank_usd else False,
+        )
+
     def _get_attachments(self, shipments, invoices):
         """Obtiene adjuntos de los embarques y de las facturas."""
         Attachment = self.env['ir.attachment']
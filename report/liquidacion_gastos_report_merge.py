@@ -2,6 +2,9 @@
 
 import base64
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from odoo import api, models
 
@@ -21,48 +24,298 @@ except ImportError:
 
 # Intentar importar PIL para convertir imágenes a PDF
 try:
-    from PIL import Image
+    from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageSequence
+    from PIL.JpegImagePlugin import JpegImageFile
     HAS_PIL = True
 except ImportError:
     HAS_PIL = False
     _logger.warning("PIL/Pillow no está instalado. No se podrán convertir imágenes a PDF.")
 
+# Tamaño máximo (en píxeles) de cada página de imagen en el PDF final
+IMAGE_MAX_SIZE = (2000, 2000)
+# Máximo de píxeles a decodificar por cuadro (~40 MP, ~120 MB en RGB).
+# Las imágenes mayores que no admiten decodificación reducida se reemplazan
+# por una página que indica el archivo omitido.
+IMAGE_MAX_DECODE_PIXELS = 40000000
+# Límites por imagen para los TIFF de varias páginas: páginas y píxeles
+# decodificados en total. Las páginas restantes se indican con una página
+# de reemplazo.
+IMAGE_MAX_PAGES = 50
+IMAGE_MAX_TOTAL_PIXELS = 200000000
+# Tamaño de la página de reemplazo (A4 a 150 dpi)
+PLACEHOLDER_PAGE_SIZE = (1240, 1754)
+
+# Hilos para leer y preparar adjuntos mientras wkhtmltopdf genera el reporte
+ATTACHMENT_PREFETCH_WORKERS = 4
+# Una sola decodificación de imagen a la vez por proceso, para mantener el
+# pico de memoria en ~IMAGE_MAX_DECODE_PIXELS; la lectura de archivos y el
+# parseo de PDF siguen en paralelo
+_IMAGE_DECODE_LOCK = threading.Semaphore(1)
+
+
+def _image_data_to_pdf(img_data, name):
+    """Convierte los bytes de una imagen a PDF.
+
+    Las imágenes JPEG se decodifican a escala reducida (modo draft), se
+    respeta la orientación EXIF y los TIFF de varias páginas generan un
+    PDF de varias páginas. Cada página se convierte a PDF en cuanto se
+    decodifica, así que sólo hay un cuadro decodificado en memoria.
+    """
+    if not HAS_PIL or not HAS_PYPDF2:
+        return None
+
+    try:
+        img = Image.open(BytesIO(img_data))
+
+        # Sólo los TIFF se expanden en varias páginas; en GIF/PNG/WebP
+        # animados y MPO (fotos de teléfono) se usa el primer cuadro
+        multi_page = img.format == 'TIFF' and getattr(img, 'n_frames', 1) > 1
+        frames = ImageSequence.Iterator(img) if multi_page else [img]
+
+        page_pdfs = []
+        total_pixels = 0
+        for index, frame in enumerate(frames):
+            if index >= IMAGE_MAX_PAGES or total_pixels >= IMAGE_MAX_TOTAL_PIXELS:
+                omitted = img.n_frames - index
+                _logger.warning(
+                    f"Imagen {name}: se omiten {omitted} páginas por exceder "
+                    f"el límite de {IMAGE_MAX_PAGES} páginas o {IMAGE_MAX_TOTAL_PIXELS} píxeles"
+                )
+                page_pdfs.append(_page_to_pdf(_placeholder_page(
+                    name, 'PÁGINAS NO INCLUIDAS',
+                    f'Se omitieron {omitted} de {img.n_frames} páginas',
+                )))
+                break
+
+            # En imágenes de varias páginas se trabaja sobre copias para no
+            # alterar el iterador
+            page = _prepare_image_page(frame, name, copy=multi_page)
+            total_pixels += frame.size[0] * frame.size[1]
+            page_pdfs.append(_page_to_pdf(page))
+            del page
+
+        if len(page_pdfs) == 1:
+            return page_pdfs[0]
+
+        merger = PdfMerger()
+        for page_pdf in page_pdfs:
+            merger.append(BytesIO(page_pdf))
+        pdf_buffer = BytesIO()
+        merger.write(pdf_buffer)
+        merger.close()
+
+        return pdf_buffer.getvalue()
+
+    except Exception as e:
+        _logger.warning(f"Error al convertir imagen a PDF: {e}")
+        return None
+
+
+def _page_to_pdf(page):
+    """Convierte una página RGB ya preparada a un PDF de una página."""
+    pdf_buffer = BytesIO()
+    page.save(pdf_buffer, format='PDF', resolution=100.0)
+    return pdf_buffer.getvalue()
+
+
+def _prepare_image_page(frame, name, copy=False):
+    """Decodifica un cuadro de imagen a RGB reducido.
+
+    Si el cuadro excede el límite de decodificación, retorna una página de
+    reemplazo que indica el archivo omitido, para que no se pierda en silencio.
+    """
+    # draft sólo aplica a JPEG (incluye MPO): decodifica directamente a 1/2, 1/4 o 1/8
+    if isinstance(frame, JpegImageFile):
+        frame.draft('RGB', IMAGE_MAX_SIZE)
+
+    width, height = frame.size
+    if width * height > IMAGE_MAX_DECODE_PIXELS:
+        _logger.warning(
+            f"Imagen {name} omitida: {width}x{height} excede "
+            f"el límite de {IMAGE_MAX_DECODE_PIXELS} píxeles"
+        )
+        return _placeholder_page(name, 'IMAGEN NO INCLUIDA', f'Tamaño: {width} x {height} píxeles')
+
+    # Redimensionar si es muy grande
+    page = frame.copy() if copy else frame
+    page.thumbnail(IMAGE_MAX_SIZE, Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS)
+
+    # Aplicar la orientación EXIF (fotos de teléfono)
+    page = ImageOps.exif_transpose(page)
+
+    # Convertir a RGB si es necesario (para evitar problemas con RGBA)
+    if page.mode in ('RGBA', 'LA', 'P'):
+        # Crear fondo blanco
+        background = Image.new('RGB', page.size, (255, 255, 255))
+        if page.mode != 'RGBA':
+            page = page.convert('RGBA')
+        background.paste(page, mask=page.split()[-1])
+        page = background
+    elif page.mode != 'RGB':
+        page = page.convert('RGB')
+
+    return page
+
+
+def _placeholder_page(name, title, detail):
+    """Página en blanco que indica que una imagen o parte de ella no se incluyó."""
+    page = Image.new('RGB', PLACEHOLDER_PAGE_SIZE, (255, 255, 255))
+    try:
+        font = ImageFont.load_default(size=32)
+    except TypeError:
+        # Pillow < 10.1 no admite tamaño en la fuente por defecto
+        font = ImageFont.load_default()
+    draw = ImageDraw.Draw(page)
+    lines = [
+        title,
+        f'Archivo: {name}',
+        detail,
+        'Excede el límite de procesamiento; adjunte el documento original.',
+    ]
+    for index, line in enumerate(lines):
+        draw.text((100, 200 + index * 60), line, fill=(0, 0, 0), font=font)
+    return page
+
+
+def _prepare_attachment_part(name, mimetype, full_path=None, raw=None):
+    """Lee, valida y convierte un adjunto a un PdfReader listo para concatenar.
+
+    Se ejecuta en un hilo aparte: no debe usar el ORM ni el cursor.
+    """
+    try:
+        if raw is None:
+            with open(full_path, 'rb') as attachment_file:
+                raw = attachment_file.read()
+
+        if mimetype == 'application/pdf':
+            pdf_data = raw
+        elif mimetype.startswith('image/') and HAS_PIL:
+            with _IMAGE_DECODE_LOCK:
+                pdf_data = _image_data_to_pdf(raw, name)
+            if not pdf_data:
+                return None
+        else:
+            return None
+
+        return PdfReader(BytesIO(pdf_data), strict=False)
+
+    except Exception as e:
+        _logger.warning(f"Error al preparar adjunto {name}: {e}")
+        return None
+
 
 class IrActionsReportLiquidacion(models.Model):
     _inherit = 'ir.actions.report'
 
     @api.model
     def _render_qweb_pdf(self, report_ref, res_ids=None, data=None, **kwargs):
-        """Override para concatenar PDFs e imágenes al reporte de liquidación."""
-        # Generar el PDF base
-        pdf_content, content_type = super()._render_qweb_pdf(report_ref, res_ids=res_ids, data=data, **kwargs)
+        """Override para concatenar PDFs e imágenes al reporte de liquidación.
 
-        # Verificar si es el reporte de liquidación
+        Los adjuntos se leen y convierten en hilos aparte mientras se genera
+        el PDF base, y se concatenan en orden al terminar.
+        """
+        # Verificar si es el reporte de liquidación que viene del wizard
         report = self._get_report(report_ref)
-        if report.report_name != 'adroc_facturacion_global.report_liquidacion_gastos':
-            return pdf_content, content_type
+        wizard = self.env['liquidacion.gastos.wizard']
+        if (report.report_name == 'adroc_facturacion_global.report_liquidacion_gastos'
+                and data and data.get('wizard_id')):
+            wizard = wizard.browse(data['wizard_id']).exists()
 
-        # Verificar si viene del wizard con adjuntos
-        if not data or not data.get('wizard_id'):
-            return pdf_content, content_type
+        if not wizard:
+            return super()._render_qweb_pdf(report_ref, res_ids=res_ids, data=data, **kwargs)
 
-        if not HAS_PYPDF2:
-            _logger.warning("PyPDF2 no disponible, no se pueden concatenar adjuntos")
-            return pdf_content, content_type
-
-        # Obtener el wizard
-        wizard = self.env['liquidacion.gastos.wizard'].browse(data['wizard_id'])
-        if not wizard.exists():
-            return pdf_content, content_type
-
-        # Usar los IDs ordenados pasados desde el wizard (vacío para Assukargo)
-        ordered_attachment_ids = data.get('ordered_attachment_ids')
+        # Usar los IDs ordenados que el wizard guardó (vacío para Assukargo)
+        prepared = wizard.prepared_data or {}
+        ordered_attachment_ids = prepared.get('ordered_attachment_ids')
         if ordered_attachment_ids is None:
             # Fallback: usar attachment_ids del wizard
             ordered_attachment_ids = wizard.attachment_ids.ids
 
-        if not ordered_attachment_ids:
-            return pdf_content, content_type
+        executor = None
+        parts = []
+        if ordered_attachment_ids and HAS_PYPDF2:
+            executor = ThreadPoolExecutor(max_workers=ATTACHMENT_PREFETCH_WORKERS)
+            parts = self._prefetch_liquidacion_attachments(executor, ordered_attachment_ids)
+
+        try:
+            # Generar el PDF base (en paralelo con la preparación de adjuntos)
+            pdf_content, content_type = super()._render_qweb_pdf(report_ref, res_ids=res_ids, data=data, **kwargs)
+
+            if ordered_attachment_ids:
+                pdf_content = self._merge_liquidacion_attachments(pdf_content, parts)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        if prepared.get('store_snapshot'):
+            self._store_liquidacion_snapshot(wizard, prepared, ordered_attachment_ids, pdf_content)
+
+        # Acumulada: anteponer los PDF ya emitidos sin volver a generarlos
+        if prepared.get('previous_snapshot_ids'):
+            snapshots = self.env['liquidacion.gastos.snapshot'].browse(prepared['previous_snapshot_ids'])
+            pdf_content = self._prepend_liquidacion_snapshots(snapshots, pdf_content)
+
+        return pdf_content, content_type
+
+    def _prefetch_liquidacion_attachments(self, executor, ordered_attachment_ids):
+        """Lanza la preparación de los adjuntos en segundo plano.
+
+        Los metadatos se leen aquí con el cursor; los hilos sólo leen el
+        filestore local y convierten. Los adjuntos que no están en el
+        filestore local se leen aquí con el ORM y se pasan ya leídos. Retorna una lista de (nombre, future) en el
+        orden indicado.
+        """
+        Attachment = self.env['ir.attachment']
+        attachments = Attachment.browse(ordered_attachment_ids).exists()
+        by_id = {att.id: att for att in attachments}
+
+        # Adjuntos preparados de antemano por el cron
+        prepared_parts = self.env['liquidacion.attachment.cache']._get_prepared_parts(attachments)
+
+        parts = []
+        for att_id in ordered_attachment_ids:
+            attachment = by_id.get(att_id)
+            if not attachment:
+                continue
+
+            # Si el cron falló se vuelve a intentar aquí; sólo se omite si
+            # también falla al imprimir
+            _state, derived_path = prepared_parts.get(att_id, (None, False))
+
+            mimetype = attachment.mimetype or ''
+            if mimetype != 'application/pdf' and not (mimetype.startswith('image/') and HAS_PIL):
+                continue
+
+            full_path = attachment.store_fname and Attachment._full_path(attachment.store_fname)
+            if derived_path:
+                # Imagen ya convertida a PDF
+                future = executor.submit(
+                    _prepare_attachment_part, attachment.name, 'application/pdf',
+                    full_path=derived_path,
+                )
+            elif full_path and os.path.isfile(full_path):
+                # Archivo en el filestore local: se lee en el hilo
+                future = executor.submit(
+                    _prepare_attachment_part, attachment.name, mimetype, full_path=full_path,
+                )
+            else:
+                # Adjunto en la base de datos o en un almacenamiento externo:
+                # se lee aquí con el ORM, que respeta ir.attachment._file_read
+                raw = attachment.raw
+                if not raw:
+                    continue
+                future = executor.submit(
+                    _prepare_attachment_part, attachment.name, mimetype, raw=raw,
+                )
+            parts.append((attachment.name, future))
+
+        return parts
+
+    def _merge_liquidacion_attachments(self, pdf_content, parts):
+        """Concatena al PDF del reporte los adjuntos preparados, en orden."""
+        if not HAS_PYPDF2:
+            _logger.warning("PyPDF2 no disponible, no se pueden concatenar adjuntos")
+            return pdf_content
 
         try:
             # Crear merger
@@ -72,75 +325,73 @@ class IrActionsReportLiquidacion(models.Model):
             merger.append(BytesIO(pdf_content))
 
             # Procesar adjuntos EN EL ORDEN EXACTO de la lista
-            Attachment = self.env['ir.attachment']
-            for att_id in ordered_attachment_ids:
-                attachment = Attachment.browse(att_id)
-                if not attachment.exists() or not attachment.datas:
+            for name, future in parts:
+                part = future.result()
+                if part is None:
                     continue
-
-                mimetype = attachment.mimetype or ''
-
-                if mimetype == 'application/pdf':
-                    # Es un PDF
-                    try:
-                        pdf_data = base64.b64decode(attachment.datas)
-                        merger.append(BytesIO(pdf_data))
-                        _logger.info(f"PDF adjunto agregado: {attachment.name}")
-                    except Exception as e:
-                        _logger.warning(f"Error al agregar PDF {attachment.name}: {e}")
-
-                elif mimetype.startswith('image/') and HAS_PIL:
-                    # Es una imagen
-                    try:
-                        img_pdf = self._image_to_pdf(attachment)
-                        if img_pdf:
-                            merger.append(BytesIO(img_pdf))
-                            _logger.info(f"Imagen convertida a PDF: {attachment.name}")
-                    except Exception as e:
-                        _logger.warning(f"Error al convertir imagen {attachment.name}: {e}")
+                try:
+                    merger.append(part)
+                    _logger.info(f"Adjunto agregado: {name}")
+                except Exception as e:
+                    _logger.warning(f"Error al agregar adjunto {name}: {e}")
 
             # Generar PDF final
             output = BytesIO()
             merger.write(output)
             merger.close()
 
-            return output.getvalue(), content_type
+            return output.getvalue()
 
         except Exception as e:
             _logger.error(f"Error al concatenar PDFs: {e}")
-            return pdf_content, content_type
+            return pdf_content
 
-    def _image_to_pdf(self, attachment):
-        """Convierte una imagen adjunta a PDF."""
-        if not HAS_PIL:
-            return None
+    def _store_liquidacion_snapshot(self, wizard, prepared, attachment_ids, pdf_content):
+        """Registra la emisión: facturas, adjuntos, totales y PDF generado."""
+        if prepared.get('invoice_ids'):
+            # Datos ya preparados por el wizard en el servidor
+            invoices = self.env['account.move'].browse(prepared['invoice_ids'])
+            shipments = self.env['mrdc.shipment'].browse(prepared['shipment_ids'])
+            totals = prepared['grand_totals']
+        else:
+            invoices = wizard.invoice_ids
+            shipments = wizard.shipment_ids
+            totals = self.env[
+                'report.adroc_facturacion_global.report_liquidacion_gastos'
+            ]._get_grand_totals(invoices)
+
+        name = ', '.join(shipments.mapped('name')) or 'Reporte'
+        return self.env['liquidacion.gastos.snapshot'].create({
+            'name': name,
+            'shipment_ids': [(6, 0, shipments.ids)],
+            'invoice_ids': [(6, 0, invoices.ids)],
+            'attachment_ids': [(6, 0, attachment_ids or [])],
+            'liquidation_mode': prepared.get('liquidation_mode', 'full'),
+            'report_type': prepared.get('report_type', 'normal'),
+            'total_gtq': totals['total_gtq'],
+            'total_usd': totals['total_usd'],
+            'pdf_file': base64.b64encode(pdf_content),
+            'pdf_filename': 'Liquidacion_Gastos_%s.pdf' % name,
+        })
+
+    def _prepend_liquidacion_snapshots(self, snapshots, pdf_content):
+        """Arma el documento acumulado con los PDF de emisiones anteriores."""
+        if not HAS_PYPDF2:
+            _logger.warning("PyPDF2 no disponible, no se puede armar la liquidación acumulada")
+            return pdf_content
 
         try:
-            # Decodificar la imagen
-            img_data = base64.b64decode(attachment.datas)
-            img = Image.open(BytesIO(img_data))
-
-            # Convertir a RGB si es necesario (para evitar problemas con RGBA)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Crear fondo blanco
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Redimensionar si es muy grande
-            max_size = (2000, 2000)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS)
-
-            # Convertir a PDF
-            pdf_buffer = BytesIO()
-            img.save(pdf_buffer, format='PDF', resolution=100.0)
-
-            return pdf_buffer.getvalue()
+            merger = PdfMerger()
+            for snapshot in snapshots:
+                if snapshot.pdf_file:
+                    merger.append(BytesIO(base64.b64decode(snapshot.pdf_file)))
+            merger.append(BytesIO(pdf_content))
+
+            output = BytesIO()
+            merger.write(output)
+            merger.close()
+            return output.getvalue()
 
         except Exception as e:
-            _logger.warning(f"Error al convertir imagen a PDF: {e}")
-            return None
+            _logger.error(f"Error al armar la liquidación acumulada: {e}")
+            return pdf_content
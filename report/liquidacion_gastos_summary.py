@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, models, tools
+from odoo.tools import SQL
+
+
+class LiquidacionGastosSummary(models.Model):
+    """Resumen de facturación por embarque, empresa y moneda.
+
+    Vista SQL sobre ``account.move`` con los mismos datos que usa el reporte
+    de Liquidación de Gastos, para tableros sin generar el PDF. Al ser una
+    vista (no una tabla materializada) siempre refleja el estado actual.
+    """
+    _name = 'liquidacion.gastos.summary'
+    _description = 'Resumen de Liquidación de Gastos por Embarque'
+    _auto = False
+    _order = 'shipment_id, company_id, currency_id'
+
+    shipment_id = fields.Many2one('mrdc.shipment', string='Embarque', readonly=True)
+    company_id = fields.Many2one('res.company', string='Empresa', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('posted', 'Publicado'),
+        ('cancel', 'Cancelado'),
+    ], string='Estado', readonly=True)
+    date_last_invoice = fields.Date(string='Última Factura', readonly=True)
+    invoice_count = fields.Integer(string='# Facturas', readonly=True)
+    amount_total = fields.Monetary(string='Total', currency_field='currency_id', readonly=True)
+    external_invoice_count = fields.Integer(string='# Facturas Cuenta Ajena', readonly=True)
+    external_amount_total = fields.Monetary(
+        string='Total Cuenta Ajena', currency_field='currency_id', readonly=True,
+    )
+    own_amount_total = fields.Monetary(
+        string='Total Propio', currency_field='currency_id', readonly=True,
+    )
+
+    def _query(self):
+        return SQL(
+            """
+            SELECT
+                MIN(m.id) AS id,
+                m.mrdc_shipment_id AS shipment_id,
+                m.company_id,
+                m.currency_id,
+                m.state,
+                MAX(m.invoice_date) AS date_last_invoice,
+                COUNT(*) AS invoice_count,
+                SUM(m.amount_total) AS amount_total,
+                COUNT(m.mrdc_external_account_id) AS external_invoice_count,
+                COALESCE(SUM(m.amount_total) FILTER (
+                    WHERE m.mrdc_external_account_id IS NOT NULL
+                ), 0) AS external_amount_total,
+                COALESCE(SUM(m.amount_total) FILTER (
+                    WHERE m.mrdc_external_account_id IS NULL
+                ), 0) AS own_amount_total
+            FROM account_move m
+            WHERE m.move_type IN ('out_invoice', 'out_refund')
+            GROUP BY m.mrdc_shipment_id, m.company_id, m.currency_id, m.state
+            """
+        )
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(SQL(
+            "CREATE OR REPLACE VIEW %s AS (%s)",
+            SQL.identifier(self._table),
+            self._query(),
+        ))
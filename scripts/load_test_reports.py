@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Prueba de carga concurrente de los reportes de facturación global.
+
+Lanza N procesos (uno por worker de Odoo simulado) que renderizan en paralelo
+``report_facturas_entregadas`` y ``report_liquidacion_gastos`` contra una base
+de datos ya poblada, pasando por los wizards igual que un usuario real.
+
+Al final reporta por reporte: throughput, latencias p50/p95/p99, número de
+consultas SQL por render y RSS pico de cada worker. El throughput se mide
+entre el primer y el último render, sin contar el arranque de los procesos
+ni la carga del registry.
+
+Con ``--fake-wkhtmltopdf`` se reemplaza wkhtmltopdf por un sustituto local que
+devuelve páginas en blanco, para medir sólo el parser, QWeb y el merge de
+adjuntos.
+
+Uso::
+
+    python scripts/load_test_reports.py -c /etc/odoo/odoo.conf -d mi_base \\
+        --workers 4 --renders 20 --report both --fake-wkhtmltopdf
+"""
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import time
+from io import BytesIO
+
+_logger = logging.getLogger('adroc_facturacion_global.load_test')
+
+REPORTS = {
+    'facturas': {
+        'report_ref': 'adroc_facturacion_global.report_facturas_entregadas',
+        'wizard': 'facturas.entregadas.wizard',
+    },
+    'liquidacion': {
+        'report_ref': 'adroc_facturacion_global.report_liquidacion_gastos',
+        'wizard': 'liquidacion.gastos.wizard',
+    },
+}
+
+# PDF mínimo de una página, usado si PyPDF2 no está disponible
+BLANK_PDF = (
+    b'%PDF-1.4\n'
+    b'1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+    b'2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+    b'3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n'
+    b'xref\n0 4\n0000000000 65535 f \n0000000009 00000 n \n'
+    b'0000000052 00000 n \n0000000101 00000 n \n'
+    b'trailer<</Size 4/Root 1 0 R>>\nstartxref\n163\n%%EOF\n'
+)
+
+
+def _blank_pdf(pages):
+    """Genera un PDF con ``pages`` páginas en blanco."""
+    try:
+        from PyPDF2 import PdfWriter
+    except ImportError:
+        return BLANK_PDF
+    writer = PdfWriter()
+    for _i in range(max(pages, 1)):
+        writer.add_blank_page(width=595, height=842)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _install_fake_wkhtmltopdf(registry):
+    """Sustituye wkhtmltopdf por un generador local de páginas en blanco."""
+    Report = registry['ir.actions.report']
+
+    def _run_wkhtmltopdf(self, bodies, *args, **kwargs):
+        return _blank_pdf(len(bodies))
+
+    def get_wkhtmltopdf_state(self):
+        return 'ok'
+
+    Report._run_wkhtmltopdf = _run_wkhtmltopdf
+    Report.get_wkhtmltopdf_state = get_wkhtmltopdf_state
+
+
+def _load_registry(options):
+    import odoo
+    from odoo.tools import config
+
+    args = ['-d', options.database]
+    if options.config:
+        args = ['-c', options.config] + args
+    config.parse_config(args)
+    return odoo.modules.registry.Registry(options.database)
+
+
+def _collect_samples(options):
+    """Selecciona los grupos de facturas a renderizar desde la base poblada.
+
+    Liquidación: un grupo por embarque. Facturas Entregadas: bloques de
+    facturas de cliente de ``--invoices-per-render`` elementos.
+    """
+    from odoo import api, SUPERUSER_ID
+
+    registry = _load_registry(options)
+    samples = {}
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        Move = env['account.move']
+        domain = [
+            ('move_type', 'in', ('out_invoice', 'out_refund')),
+            ('state', '=', 'posted'),
+        ]
+
+        groups = Move._read_group(
+            domain + [('mrdc_shipment_id', '!=', False)],
+            groupby=['mrdc_shipment_id'],
+            aggregates=['id:array_agg'],
+            limit=options.renders,
+        )
+        samples['liquidacion'] = [invoice_ids for _shipment, invoice_ids in groups]
+
+        invoice_ids = Move.search(
+            domain, limit=options.invoices_per_render * options.renders,
+        ).ids
+        size = options.invoices_per_render
+        samples['facturas'] = [
+            invoice_ids[i:i + size] for i in range(0, len(invoice_ids), size)
+        ]
+    return samples
+
+
+def _worker(payload):
+    """Ejecuta los renders asignados a un worker y devuelve sus mediciones."""
+    options, jobs = payload
+    from odoo import api, SUPERUSER_ID
+
+    registry = _load_registry(options)
+    if options.fake_wkhtmltopdf:
+        _install_fake_wkhtmltopdf(registry)
+
+    results = []
+    for report_key, invoice_ids in jobs:
+        spec = REPORTS[report_key]
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            start_queries = cr.sql_log_count
+            started_at = time.time()
+            start = time.perf_counter()
+
+            wizard = env[spec['wizard']].with_context(
+                active_model='account.move',
+                active_ids=invoice_ids,
+            ).create({})
+            action = wizard.action_print_report()
+            env['ir.actions.report']._render_qweb_pdf(
+                spec['report_ref'], res_ids=invoice_ids, data=action.get('data'),
+            )
+
+            results.append({
+                'report': report_key,
+                'elapsed': time.perf_counter() - start,
+                'queries': cr.sql_log_count - start_queries,
+                # Marcas de tiempo absolutas, comparables entre procesos
+                'started_at': started_at,
+                'ended_at': time.time(),
+            })
+            # No dejar rastro de los wizards en la base
+            cr.rollback()
+
+    return {
+        'results': results,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _percentile(values, pct):
+    """Percentil por rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _render_window(results):
+    """Segundos entre el inicio del primer render y el fin del último."""
+    if not results:
+        return 0.0
+    return max(r['ended_at'] for r in results) - min(r['started_at'] for r in results)
+
+
+def _print_summary(worker_data, wall_time):
+    results = [res for data in worker_data for res in data['results']]
+    print('Renders totales: %d en %.2f s de render (%.2f s incluyendo arranque)' % (
+        len(results), _render_window(results), wall_time,
+    ))
+
+    for report_key in REPORTS:
+        report_results = [r for r in results if r['report'] == report_key]
+        if not report_results:
+            continue
+        latencies = [r['elapsed'] for r in report_results]
+        queries = [r['queries'] for r in report_results]
+        window = _render_window(report_results)
+        print('\n[%s]' % report_key)
+        print('  renders:     %d' % len(report_results))
+        print('  throughput:  %.2f renders/s' % (len(report_results) / window if window else 0.0))
+        print('  latencia p50: %.3f s  p95: %.3f s  p99: %.3f s' % (
+            _percentile(latencies, 50),
+            _percentile(latencies, 95),
+            _percentile(latencies, 99),
+        ))
+        print('  consultas/render: media %.1f  máx %d' % (
+            sum(queries) / len(queries), max(queries),
+        ))
+
+    print('\nRSS pico por worker:')
+    for index, data in enumerate(worker_data):
+        print('  worker %d: %.1f MB' % (index, data['peak_rss_kb'] / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', help='Archivo de configuración de Odoo')
+    parser.add_argument('-d', '--database', required=True, help='Base de datos poblada')
+    parser.add_argument('--workers', type=int, default=4, help='Procesos concurrentes')
+    parser.add_argument('--renders', type=int, default=10, help='Renders por reporte')
+    parser.add_argument('--report', choices=['facturas', 'liquidacion', 'both'], default='both')
+    parser.add_argument('--invoices-per-render', type=int, default=50,
+                        help='Facturas por render de Facturas Entregadas')
+    parser.add_argument('--fake-wkhtmltopdf', action='store_true',
+                        help='Usar un sustituto local de wkhtmltopdf')
+    options = parser.parse_args()
+
+    samples = _collect_samples(options)
+    report_keys = list(REPORTS) if options.report == 'both' else [options.report]
+
+    jobs = []
+    for report_key in report_keys:
+        groups = samples.get(report_key) or []
+        if not groups:
+            _logger.warning("No hay facturas para el reporte %s", report_key)
+            continue
+        for i in range(options.renders):
+            jobs.append((report_key, groups[i % len(groups)]))
+
+    if not jobs:
+        parser.error('La base de datos no tiene facturas de cliente para renderizar.')
+
+    # Repartir los renders entre los workers de forma intercalada
+    workers = max(options.workers, 1)
+    payloads = [(options, jobs[i::workers]) for i in range(workers)]
+    payloads = [payload for payload in payloads if payload[1]]
+
+    start = time.perf_counter()
+    # spawn: cada worker abre sus propias conexiones, sin heredar las del padre
+    ctx = multiprocessing.get_context('spawn')
+    # maxtasksperchild=1: un proceso por payload, para medir el RSS de cada worker
+    with ctx.Pool(len(payloads), maxtasksperchild=1) as pool:
+        worker_data = pool.map(_worker, payloads, chunksize=1)
+    wall_time = time.perf_counter() - start
+
+    _print_summary(worker_data, wall_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,3 +2,5 @@
 
 from . import liquidacion_gastos_wizard
 from . import facturas_entregadas_wizard
+from . import actualizacion_contrasena_wizard
+from . import busqueda_cuenta_ajena_wizard
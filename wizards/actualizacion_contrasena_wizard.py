@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from markupsafe import Markup
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, split_every
+
+# Facturas por mensaje de chatter en lote
+CHATTER_BATCH_SIZE = 1000
+
+
+class ActualizacionContrasenaWizard(models.TransientModel):
+    _name = 'actualizacion.contrasena.wizard'
+    _description = 'Wizard para actualizar Fecha Pago Contraseña y Comentario en lote'
+
+    invoice_count = fields.Integer(
+        string='# Facturas',
+        readonly=True,
+    )
+
+    update_password_payment_date = fields.Boolean(string='Actualizar Fecha Pago Contraseña')
+    password_payment_date = fields.Date(string='Fecha Pago Contraseña')
+
+    update_invoice_comment = fields.Boolean(string='Actualizar Comentario')
+    invoice_comment = fields.Text(string='Comentario Factura')
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        domain = self.env['account.move']._get_customer_invoice_domain()
+
+        if not domain:
+            raise UserError(_('Debe seleccionar al menos una factura.'))
+
+        res['invoice_count'] = self.env['account.move'].search_count(domain)
+        return res
+
+    def action_apply(self):
+        """Aplica los valores a todas las facturas con un solo UPDATE."""
+        self.ensure_one()
+        Move = self.env['account.move']
+
+        values = {}
+        if self.update_password_payment_date:
+            values['password_payment_date'] = self.password_payment_date or None
+        if self.update_invoice_comment:
+            values['invoice_comment'] = self.invoice_comment or None
+        if not values:
+            raise UserError(_('Debe indicar al menos un campo a actualizar.'))
+
+        domain = Move._get_customer_invoice_domain()
+        if not domain:
+            raise UserError(_('Debe seleccionar al menos una factura.'))
+
+        invoices = Move.search(domain)
+        if not invoices:
+            raise UserError(_('Debe seleccionar facturas de cliente.'))
+
+        # Validar permisos y reglas de escritura una sola vez para todo el lote
+        invoices.check_access('write')
+
+        # Enviar a la base las escrituras pendientes del ORM antes del SQL directo
+        Move.flush_model(list(values) + ['write_uid', 'write_date'])
+
+        # Escritura directa: sólo estos campos, sin recálculos ni chequeos por registro
+        assignments = [
+            SQL('%s = %s', SQL.identifier(field_name), value)
+            for field_name, value in values.items()
+        ]
+        self.env.cr.execute(SQL(
+            "UPDATE account_move SET %s, write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC' "
+            "WHERE id = ANY(%s)",
+            SQL(', ').join(assignments),
+            self.env.uid,
+            invoices.ids,
+        ))
+        Move.invalidate_model(list(values) + ['write_uid', 'write_date'])
+
+        self._log_bulk_update(invoices, values)
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': _('%s facturas actualizadas.', len(invoices)),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
+
+    def _log_bulk_update(self, invoices, values):
+        """Registra el cambio en el chatter de cada factura, por lotes."""
+        lines = []
+        if 'password_payment_date' in values:
+            lines.append(_('Fecha Pago Contraseña: %s', self.password_payment_date or '-'))
+        if 'invoice_comment' in values:
+            lines.append(_('Comentario Factura: %s', self.invoice_comment or '-'))
+        body = Markup('<br/>').join(
+            [Markup('<b>%s</b>') % _('Actualización en lote')] + lines
+        )
+
+        for batch_ids in split_every(CHATTER_BATCH_SIZE, invoices.ids):
+            self.env['account.move'].browse(batch_ids)._message_log_batch(
+                bodies=dict.fromkeys(batch_ids, body),
+            )
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import re
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, escape_psql
+from odoo.tools.sql import column_exists
+
+from ..models.account_move import EXPENSE_NUMBER_COLUMNS, EXPENSE_SERIES_COLUMNS
+
+# Separadores entre números pegados (líneas, comas, punto y coma)
+LINE_SEPARATOR_RE = re.compile(r'[\r\n,;]+')
+
+
+class BusquedaCuentaAjenaWizard(models.TransientModel):
+    _name = 'busqueda.cuenta.ajena.wizard'
+    _description = 'Wizard para buscar facturas por Serie y No. Factura de Cuenta Ajena'
+
+    numbers = fields.Text(
+        string='Números de Factura CA',
+        required=True,
+        help='Un número por línea. Si la línea trae serie y número separados '
+             'por espacio o tabulador (por ejemplo, pegado desde Excel), se '
+             'buscan ambos.',
+    )
+    partial_match = fields.Boolean(
+        string='Coincidencia parcial',
+        help='Busca números que contengan el texto indicado.',
+    )
+
+    def _parse_numbers(self):
+        """Retorna listas paralelas de series (o None) y números."""
+        series_list = []
+        number_list = []
+        for line in LINE_SEPARATOR_RE.split(self.numbers or ''):
+            parts = line.split()
+            if not parts:
+                continue
+            series_list.append(parts[0] if len(parts) > 1 else None)
+            number_list.append(parts[-1])
+        return series_list, number_list
+
+    def _search_invoice_ids(self, series_list, number_list):
+        """Resuelve todas las búsquedas con una sola consulta sobre cuenta ajena."""
+        cr = self.env.cr
+        Move = self.env['account.move']
+
+        # Las columnas x_studio_* sólo existen si fueron creadas con Studio
+        number_columns = [c for c in EXPENSE_NUMBER_COLUMNS if column_exists(cr, Move._table, c)]
+        series_columns = [c for c in EXPENSE_SERIES_COLUMNS if column_exists(cr, Move._table, c)]
+        if not number_columns:
+            raise UserError(_('No hay campos de número de factura para buscar.'))
+
+        if self.partial_match:
+            # Patrones ILIKE, resueltos con los índices trigram
+            number_list = ['%' + escape_psql(number) + '%' for number in number_list]
+            operator = SQL('ILIKE')
+        else:
+            operator = SQL('=')
+        number_match = SQL(' OR ').join(
+            SQL('e.%s %s q.number', SQL.identifier(column), operator)
+            for column in number_columns
+        )
+
+        # Sin columnas de serie, la serie pegada se ignora
+        series_match = SQL(' OR ').join(
+            [SQL('q.series IS NULL')] + [
+                SQL('e.%s = q.series', SQL.identifier(column))
+                for column in series_columns
+            ]
+        ) if series_columns else SQL('TRUE')
+
+        cr.execute(SQL(
+            """
+            SELECT DISTINCT l.move_id
+            FROM unnest(%s::varchar[], %s::varchar[]) AS q(series, number)
+            JOIN %s e ON (%s)
+            JOIN %s l ON l.expense_id = e.id
+            WHERE l.move_id IS NOT NULL
+              AND (%s)
+            """,
+            series_list,
+            number_list,
+            SQL.identifier(Move._table),
+            number_match,
+            SQL.identifier(self.env['mrdc.external_account.line']._table),
+            series_match,
+        ))
+        return [row[0] for row in cr.fetchall()]
+
+    def action_search(self):
+        """Busca las facturas de cliente vinculadas a los números pegados."""
+        self.ensure_one()
+        series_list, number_list = self._parse_numbers()
+        if not number_list:
+            raise UserError(_('Debe ingresar al menos un número de factura.'))
+
+        invoice_ids = self._search_invoice_ids(series_list, number_list)
+        # Aplicar permisos y reglas de registro sobre el resultado
+        invoices = self.env['account.move'].search([('id', 'in', invoice_ids)])
+
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Facturas por Cuenta Ajena (%s de %s)', len(invoices), len(number_list)),
+            'res_model': 'account.move',
+            'view_mode': 'list,form',
+            'views': [(self.env.ref('account.view_invoice_tree').id, 'list'), (False, 'form')],
+            'domain': [('id', 'in', invoices.ids)],
+            'context': {'default_move_type': 'out_invoice'},
+            'target': 'current',
+        }
@@ -1,20 +1,37 @@
 # -*- coding: utf-8 -*-
 
+import base64
+import logging
+import re
+import zipfile
+from io import BytesIO
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
+# Intentar importar PyPDF2 para separar el PDF por cliente
+try:
+    from PyPDF2 import PdfReader, PdfWriter
+    HAS_PYPDF2 = True
+except ImportError:
+    try:
+        from PyPDF2 import PdfFileReader as PdfReader, PdfFileWriter as PdfWriter
+        HAS_PYPDF2 = True
+    except ImportError:
+        HAS_PYPDF2 = False
+
+# Marcador que el template imprime al inicio de cada cliente
+PARTNER_MARKER_RE = re.compile(r'\[\[FE-PARTNER-(\d+)\]\]')
+
 
 class FacturasEntregadasWizard(models.TransientModel):
     _name = 'facturas.entregadas.wizard'
     _description = 'Wizard para Reporte de Facturas Entregadas'
 
-    invoice_ids = fields.Many2many(
-        'account.move',
-        'facturas_entregadas_wizard_invoice_rel',
-        'wizard_id',
-        'invoice_id',
-        string='Facturas',
-    )
+    # Dominio de las facturas seleccionadas; se resuelve al imprimir para
+    # no materializar la selección en el wizard
+    invoice_domain = fields.Json(string='Dominio de facturas')
 
     line_ids = fields.One2many(
         'facturas.entregadas.wizard.line',
@@ -22,66 +39,58 @@ class FacturasEntregadasWizard(models.TransientModel):
         string='Clientes',
     )
 
+    output_mode = fields.Selection([
+        ('combined', 'PDF combinado'),
+        ('zip', 'ZIP con un PDF por cliente'),
+        ('attachments', 'Adjuntar PDF a cada cliente'),
+    ], string='Salida', default='combined', required=True,
+        help='Los modos por cliente generan el reporte en una sola pasada '
+             'y luego lo separan por cliente.')
+
     @api.model
     def default_get(self, fields_list):
         res = super().default_get(fields_list)
-        active_ids = self._context.get('active_ids', [])
-        active_model = self._context.get('active_model')
+        Move = self.env['account.move']
+        domain = Move._get_customer_invoice_domain()
 
-        if active_model != 'account.move' or not active_ids:
+        if not domain:
             raise UserError(_('Debe seleccionar al menos una factura.'))
 
-        invoices = self.env['account.move'].browse(active_ids)
-
-        # Filtrar solo facturas de cliente
-        customer_invoices = invoices.filtered(
-            lambda inv: inv.move_type in ('out_invoice', 'out_refund')
-        )
-
-        if not customer_invoices:
+        # Filtrar solo facturas de cliente (en SQL)
+        if not Move.search(domain, limit=1):
             raise UserError(_('Debe seleccionar facturas de cliente.'))
 
-        res['invoice_ids'] = [(6, 0, customer_invoices.ids)]
+        if 'invoice_domain' in fields_list:
+            res['invoice_domain'] = domain
 
         # Generar líneas agrupadas por cliente
         if 'line_ids' in fields_list:
-            res['line_ids'] = self._prepare_lines(customer_invoices)
+            res['line_ids'] = self._prepare_lines(domain)
 
         return res
 
-    def _prepare_lines(self, invoices):
-        """Prepara las líneas del wizard agrupadas por cliente."""
-        # Filtrar facturas que tengan cliente asignado
-        invoices_with_partner = invoices.filtered(lambda inv: inv.partner_id)
-
-        # Agrupar facturas por partner
-        partner_invoices = {}
-        for invoice in invoices_with_partner:
-            partner = invoice.partner_id
-            if partner and partner.id:
-                if partner.id not in partner_invoices:
-                    partner_invoices[partner.id] = {
-                        'partner': partner,
-                        'invoices': self.env['account.move'],
-                    }
-                partner_invoices[partner.id]['invoices'] |= invoice
+    def _prepare_lines(self, domain):
+        """Prepara las líneas del wizard agrupadas por cliente.
+
+        La agrupación, el conteo y la suma se resuelven en SQL.
+        """
+        groups = self.env['account.move']._read_group(
+            domain + [('partner_id', '!=', False)],
+            groupby=['partner_id'],
+            aggregates=['__count', 'amount_total:sum'],
+        )
 
         # Crear comandos para líneas
         lines_commands = []
-        for partner_id, data in partner_invoices.items():
-            partner = data['partner']
-            if not partner or not partner.id:
-                continue
-            partner_invs = data['invoices']
+        for partner, invoice_count, total_amount in groups:
             # Construir la dirección por defecto del partner
             default_address = self._get_partner_address(partner)
 
             lines_commands.append((0, 0, {
                 'partner_id': partner.id,
-                'invoice_ids': [(6, 0, partner_invs.ids)],
                 'address': default_address,
-                'invoice_count': len(partner_invs),
-                'total_amount': sum(partner_invs.mapped('amount_total')),
+                'invoice_count': invoice_count,
+                'total_amount': total_amount,
             }))
 
         return lines_commands
@@ -104,24 +113,153 @@ class FacturasEntregadasWizard(models.TransientModel):
 
         return ', '.join(parts) if parts else ''
 
+    def _get_report_data(self):
+        """Datos que recibe el parser: sólo el wizard, el resto queda en el servidor."""
+        return {'wizard_id': self.id}
+
+    def _get_prepared_report_data(self):
+        """Datos del reporte con las facturas agrupadas por cliente en SQL.
+
+        Las líneas sólo muestran conteo y total, así que la agrupación se
+        hace sobre ``invoice_domain`` al imprimir; de las líneas sólo se
+        toma la dirección.
+        """
+        self.ensure_one()
+        invoices = self._get_invoices()
+        if not invoices:
+            raise UserError(_('Debe seleccionar facturas de cliente.'))
+
+        custom_addresses = {line.partner_id.id: line.address for line in self.line_ids}
+        partner_groups = self.env['account.move']._read_group(
+            self.invoice_domain + [('partner_id', '!=', False)],
+            groupby=['partner_id'],
+            aggregates=['id:array_agg', 'amount_total:sum'],
+        )
+
+        return self.env[
+            'report.adroc_facturacion_global.report_facturas_entregadas'
+        ]._prepare_report_data(invoices, custom_addresses, partner_groups)
+
+    def _get_invoices(self):
+        """Facturas de cliente del wizard, resueltas en SQL."""
+        self.ensure_one()
+        if not self.invoice_domain:
+            return self.env['account.move']
+        return self.env['account.move'].search(self.invoice_domain)
+
     def action_print_report(self):
         """Genera el reporte de facturas entregadas con las direcciones personalizadas."""
         self.ensure_one()
 
-        # Preparar datos de direcciones personalizadas
-        custom_addresses = {}
-        for line in self.line_ids:
-            custom_addresses[line.partner_id.id] = line.address
+        if self.output_mode != 'combined':
+            return self._print_split_by_partner()
 
         return self.env.ref(
             'adroc_facturacion_global.action_report_facturas_entregadas'
         ).report_action(
-            self.invoice_ids,
-            data={
-                'wizard_id': self.id,
-                'custom_addresses': custom_addresses,
+            None,
+            data=self._get_report_data(),
+        )
+
+    def _print_split_by_partner(self):
+        """Genera un PDF por cliente, como ZIP descargable o adjunto a cada cliente."""
+        if not HAS_PYPDF2:
+            raise UserError(_('PyPDF2 no está instalado. No se puede separar el reporte por cliente.'))
+
+        if self.output_mode == 'zip':
+            # El ZIP se genera y sirve en la descarga, sin guardarlo en el filestore
+            return {
+                'type': 'ir.actions.act_url',
+                'url': '/adroc_facturacion_global/facturas_entregadas/%s/zip' % self.id,
+                'target': 'self',
             }
+
+        attachments = self.env['ir.attachment'].create([{
+            'name': filename,
+            'type': 'binary',
+            'datas': base64.b64encode(partner_pdf),
+            'res_model': 'res.partner',
+            'res_id': partner.id,
+            'mimetype': 'application/pdf',
+        } for partner, filename, partner_pdf in self._render_partner_files()])
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Facturas por Enviar'),
+            'res_model': 'ir.attachment',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', attachments.ids)],
+            'target': 'current',
+        }
+
+    def _render_partner_files(self):
+        """Renderiza todos los clientes en una sola pasada y separa el PDF por cliente.
+
+        Retorna una lista de tuplas (partner, filename, pdf_bytes).
+        """
+        self.ensure_one()
+        if not HAS_PYPDF2:
+            raise UserError(_('PyPDF2 no está instalado. No se puede separar el reporte por cliente.'))
+
+        data = dict(self._get_report_data(), split_by_partner=True)
+        pdf_content, _content_type = self.env['ir.actions.report']._render_qweb_pdf(
+            'adroc_facturacion_global.report_facturas_entregadas',
+            res_ids=None,
+            data=data,
         )
+        partner_pdfs = self._split_pdf_by_partner(pdf_content)
+        if not partner_pdfs:
+            raise UserError(_('No se pudo separar el reporte por cliente.'))
+
+        Partner = self.env['res.partner']
+        files = []
+        for partner_id, partner_pdf in partner_pdfs:
+            partner = Partner.browse(partner_id)
+            # El ID evita nombres repetidos en el ZIP con contactos duplicados
+            filename = 'Facturas_por_Enviar_%s_%s.pdf' % (
+                self._safe_filename(partner.name or ''), partner_id,
+            )
+            files.append((partner, filename, partner_pdf))
+        return files
+
+    def _get_partner_zip(self):
+        """Arma el ZIP con un PDF por cliente. Retorna (filename, zip_bytes)."""
+        zip_buffer = BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for _partner, filename, partner_pdf in self._render_partner_files():
+                zip_file.writestr(filename, partner_pdf)
+        return 'Facturas_por_Enviar.zip', zip_buffer.getvalue()
+
+    def _split_pdf_by_partner(self, pdf_content):
+        """Separa el PDF usando los marcadores de cliente.
+
+        Retorna una lista de tuplas (partner_id, pdf_bytes) en el orden del reporte.
+        """
+        reader = PdfReader(BytesIO(pdf_content))
+        chunks = []
+        for page in reader.pages:
+            extract = getattr(page, 'extract_text', None) or page.extractText
+            match = PARTNER_MARKER_RE.search(extract() or '')
+            if match:
+                chunks.append((int(match.group(1)), []))
+            elif not chunks:
+                _logger.warning("Página sin marcador de cliente al inicio del reporte, se omite")
+                continue
+            chunks[-1][1].append(page)
+
+        result = []
+        for partner_id, pages in chunks:
+            writer = PdfWriter()
+            for page in pages:
+                add_page = getattr(writer, 'add_page', None) or writer.addPage
+                add_page(page)
+            output = BytesIO()
+            writer.write(output)
+            result.append((partner_id, output.getvalue()))
+        return result
+
+    def _safe_filename(self, name):
+        """Limpia un nombre para usarlo como nombre de archivo."""
+        return re.sub(r'[^\w\-]+', '_', name).strip('_') or 'Cliente'
 
 
 class FacturasEntregadasWizardLine(models.TransientModel):
@@ -141,14 +279,6 @@ class FacturasEntregadasWizardLine(models.TransientModel):
         required=True,
     )
 
-    invoice_ids = fields.Many2many(
-        'account.move',
-        'facturas_entregadas_wizard_line_invoice_rel',
-        'line_id',
-        'invoice_id',
-        string='Facturas',
-    )
-
     address = fields.Text(
         string='Dirección de Entrega',
         help='Dirección donde se entregarán las facturas. Por defecto se usa la dirección del cliente.',
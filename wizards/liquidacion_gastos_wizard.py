@@ -3,6 +3,10 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+# Máximo de facturas por liquidación: el wizard las lista y crea una línea
+# por adjunto, así que no se abre sobre selecciones masivas
+LIQUIDACION_MAX_INVOICES = 1000
+
 
 class LiquidacionGastosWizardAttachmentLine(models.TransientModel):
     _name = 'liquidacion.gastos.wizard.attachment.line'
@@ -81,6 +85,30 @@ class LiquidacionGastosWizard(models.TransientModel):
         ('assukargo', 'Assukargo'),
     ], string='Formato de Reporte', default='normal', required=True)
 
+    liquidation_mode = fields.Selection([
+        ('full', 'Completa'),
+        ('delta', 'Sólo lo nuevo desde la última liquidación'),
+        ('cumulative', 'Acumulada (emisiones anteriores + lo nuevo)'),
+    ], string='Modo de Liquidación', default='full', required=True,
+        help='Sólo lo nuevo y Acumulada excluyen las facturas y adjuntos ya '
+             'liquidados. Acumulada antepone los PDF emitidos anteriormente '
+             'sin volver a generarlos.')
+
+    store_snapshot = fields.Boolean(
+        string='Registrar emisión',
+        default=True,
+        help='Guarda las facturas, adjuntos, totales y el PDF de esta liquidación.',
+    )
+
+    # Datos del reporte preparados en el servidor (ver _set_prepared_data)
+    prepared_data = fields.Json(string='Datos preparados', readonly=True)
+
+    previous_snapshot_ids = fields.Many2many(
+        'liquidacion.gastos.snapshot',
+        string='Liquidaciones anteriores',
+        compute='_compute_previous_snapshots',
+    )
+
     invoice_ids = fields.Many2many(
         'account.move',
         'liquidacion_gastos_wizard_invoice_rel',
@@ -134,6 +162,30 @@ class LiquidacionGastosWizard(models.TransientModel):
             shipments = wizard.invoice_ids.mapped('mrdc_shipment_id')
             wizard.shipment_ids = shipments.filtered(lambda s: s)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        # prepared_data lo calcula default_get en el servidor, nunca el cliente
+        vals_list = [
+            {key: value for key, value in vals.items() if key != 'prepared_data'}
+            for vals in vals_list
+        ]
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if 'prepared_data' in vals:
+            vals = {key: value for key, value in vals.items() if key != 'prepared_data'}
+        return super().write(vals)
+
+    def _set_prepared_data(self, prepared):
+        """Guarda los datos preparados; write() no permite modificarlos."""
+        return super().write({'prepared_data': prepared})
+
+    @api.depends('shipment_ids')
+    def _compute_previous_snapshots(self):
+        Snapshot = self.env['liquidacion.gastos.snapshot']
+        for wizard in self:
+            wizard.previous_snapshot_ids = Snapshot._get_previous_snapshots(wizard.shipment_ids)
+
     @api.depends('invoice_ids', 'shipment_ids')
     def _compute_available_attachments(self):
         Attachment = self.env['ir.attachment']
@@ -155,18 +207,22 @@ class LiquidacionGastosWizard(models.TransientModel):
     @api.model
     def default_get(self, fields_list):
         res = super().default_get(fields_list)
-        active_ids = self._context.get('active_ids', [])
-        active_model = self._context.get('active_model')
+        Move = self.env['account.move']
+        domain = Move._get_customer_invoice_domain()
 
-        if active_model != 'account.move' or not active_ids:
+        if not domain:
             raise UserError(_('Debe seleccionar al menos una factura.'))
 
-        invoices = self.env['account.move'].browse(active_ids)
+        # Rechazar selecciones masivas con un conteo acotado, antes de cargarlas
+        invoice_count = Move.search_count(domain, limit=LIQUIDACION_MAX_INVOICES + 1)
+        if invoice_count > LIQUIDACION_MAX_INVOICES:
+            raise UserError(_(
+                'La liquidación admite como máximo %s facturas. '
+                'Filtre la lista por embarque antes de generarla.'
+            ) % LIQUIDACION_MAX_INVOICES)
 
-        # Filtrar solo facturas de cliente
-        customer_invoices = invoices.filtered(
-            lambda inv: inv.move_type in ('out_invoice', 'out_refund')
-        )
+        # Filtrar solo facturas de cliente (en SQL)
+        customer_invoices = Move.search(domain)
 
         if not customer_invoices:
             raise UserError(_('Debe seleccionar facturas de cliente.'))
@@ -175,7 +231,19 @@ class LiquidacionGastosWizard(models.TransientModel):
 
         # Obtener todos los adjuntos disponibles
         Attachment = self.env['ir.attachment']
-        shipments = customer_invoices.mapped('mrdc_shipment_id').filtered(lambda s: s)
+        shipment_groups = Move._read_group(
+            domain + [('mrdc_shipment_id', '!=', False)],
+            groupby=['mrdc_shipment_id'],
+        )
+        shipments = self.env['mrdc.shipment'].browse([
+            shipment.id for shipment, in shipment_groups
+        ])
+
+        # Agrupar y totalizar una sola vez, con los embarques ya resueltos
+        if 'prepared_data' in fields_list:
+            res['prepared_data'] = self.env[
+                'report.adroc_facturacion_global.report_liquidacion_gastos'
+            ]._prepare_invoice_data(customer_invoices, shipments)
 
         # Adjuntos de embarques
         shipment_attachments = Attachment.search([
@@ -208,6 +276,8 @@ class LiquidacionGastosWizard(models.TransientModel):
         """Genera el reporte de liquidación de gastos con los adjuntos seleccionados."""
         self.ensure_one()
 
+        invoices = self.invoice_ids
+
         # Assukargo no incluye adjuntos
         if self.report_type == 'assukargo':
             ordered_attachment_ids = []
@@ -217,12 +287,51 @@ class LiquidacionGastosWizard(models.TransientModel):
                 lambda l: l.include
             ).sorted('sequence').mapped('attachment_id').ids
 
+        previous_snapshots = self.previous_snapshot_ids
+        if self.liquidation_mode != 'full' and previous_snapshots:
+            # Excluir lo que ya fue liquidado en emisiones anteriores
+            invoices -= previous_snapshots.mapped('invoice_ids')
+            liquidated_attachment_ids = set(previous_snapshots.mapped('attachment_ids').ids)
+            ordered_attachment_ids = [
+                att_id for att_id in ordered_attachment_ids
+                if att_id not in liquidated_attachment_ids
+            ]
+            if not invoices:
+                raise UserError(_('No hay facturas nuevas desde la última liquidación.'))
+
+        Report = self.env['report.adroc_facturacion_global.report_liquidacion_gastos']
+        prepared = dict(self.prepared_data or {})
+        if set(prepared.get('invoice_ids') or []) != set(invoices.ids):
+            # Modo delta o wizard sin datos preparados: agrupar sólo lo que se imprime
+            prepared = Report._prepare_invoice_data(invoices)
+
+        if ordered_attachment_ids:
+            attachments = self.env['ir.attachment'].browse(ordered_attachment_ids)
+        else:
+            # Sin selección (Assukargo): todos los adjuntos, como en el parser
+            attachments = Report._get_attachments(
+                self.env['mrdc.shipment'].browse(prepared['shipment_ids']), invoices,
+            )['all']
+
+        prepared.update({
+            'attachments': Report._prepare_attachment_data(attachments),
+            'ordered_attachment_ids': ordered_attachment_ids,
+            'report_type': self.report_type,
+            'liquidation_mode': self.liquidation_mode,
+            'store_snapshot': self.store_snapshot,
+            'previous_snapshot_ids': (
+                previous_snapshots._get_cumulative_snapshots(previous_snapshots).ids
+                if self.liquidation_mode == 'cumulative' else []
+            ),
+        })
+        self._set_prepared_data(prepared)
+
+        # Sólo viaja el wizard: los datos y totales quedan en el servidor
         return self.env.ref(
             'adroc_facturacion_global.action_report_liquidacion_gastos'
-        ).report_action(self.invoice_ids, data={
+        ).report_action(invoices, data={
             'wizard_id': self.id,
             'report_type': self.report_type,
-            'ordered_attachment_ids': ordered_attachment_ids,
         })
 
     def action_select_all(self):